@@ -2,10 +2,25 @@ import streamlit as st
 import requests
 from bs4 import BeautifulSoup
 import pandas as pd
+import numpy as np
+import io
+import gzip
 import json
+import orjson
+import html
+import http.cookiejar
+import functools
+import itertools
+import threading
 import time
 from urllib.parse import urljoin, urlparse
 import re
+from collections import Counter, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import urllib3
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
 
 # Configure page
 st.set_page_config(
@@ -30,58 +45,189 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Rate limiting and transient server errors - retried by the session and never cached as results
+RETRYABLE_STATUSES = (429, 500, 502, 503, 504)
+
+# Longest Retry-After wait honoured before a retry, so a rate-limited store can't stall a scrape for hours
+MAX_RETRY_AFTER_SECONDS = 30
+
+class CappedRetry(Retry):
+    """Retry policy that honours Retry-After but never waits longer than MAX_RETRY_AFTER_SECONDS"""
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, MAX_RETRY_AFTER_SECONDS)
+
+@st.cache_resource
+def get_http_session():
+    """Create a pooled HTTP session shared by all scraper functions across reruns"""
+    session = requests.Session()
+    session.headers.update({
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
+    })
+    
+    # The session is shared by every user and store, so refuse all cookies - a store's localization
+    # or currency cookie would otherwise change prices and content in other users' scrapes
+    session.cookies.set_policy(http.cookiejar.DefaultCookiePolicy(allowed_domains=[]))
+    
+    # Keep-alive connection pool with retries on rate limiting and transient server errors,
+    # backing off exponentially or for as long as the server's Retry-After header asks (capped).
+    # Connection failures and timeouts get a single retry so unreachable stores fail fast
+    retry = CappedRetry(
+        total=5,
+        connect=1,
+        read=1,
+        status=5,
+        backoff_factor=0.5,
+        status_forcelist=RETRYABLE_STATUSES,
+        allowed_methods={'GET', 'HEAD'},
+        respect_retry_after_header=True
+    )
+    adapter = HTTPAdapter(pool_connections=20, pool_maxsize=50, max_retries=retry)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+SESSION = get_http_session()
+
+class IncompleteScrapeError(Exception):
+    """Raised by a cached fetch that only partly succeeded, so its partial result is used but never cached"""
+    def __init__(self, message, result):
+        super().__init__(message)
+        self.result = result
+
+# Pagination and concurrency limits for the JSON endpoints
+MAX_PRODUCT_PAGES = 50
+PAGE_FETCH_CONCURRENCY = 8  # Pages requested per pagination batch
+MAX_CONCURRENT_REQUESTS = 16  # Requests in flight at once across all scraping
+
+@st.cache_resource
+def get_http_executor():
+    """Create the worker pool shared by all concurrent HTTP fetches across reruns"""
+    return ThreadPoolExecutor(max_workers=MAX_CONCURRENT_REQUESTS, thread_name_prefix='scraper-http')
+
+HTTP_EXECUTOR = get_http_executor()
+
+# Shopify fingerprints - storefront response headers, then a case-insensitive body pattern
+# (also covers cdn.shopify.com) scanned over the raw bytes at the start of the homepage
+SHOPIFY_HEADERS = ('x-shopid', 'x-shopify-stage')
+SHOPIFY_MARKER_RE = re.compile(rb'shopify', re.IGNORECASE)
+HOMEPAGE_SNIFF_BYTES = 64 * 1024
+
+# Regexes used per product, compiled once
+WHITESPACE_RE = re.compile(r'\s+')
+NON_ALPHANUMERIC_RE = re.compile(r'[^a-zA-Z0-9\s]')
+HTML_TAG_RE = re.compile(r'<[^>]+>')  # Strips body_html down to text without building a parse tree
+
+# Compact per-image record used to match variants to their images
+ProductImage = namedtuple('ProductImage', ['src', 'alt', 'position'])
+
+# str.translate table deleting control characters other than newline, carriage return and tab
+CONTROL_CHARS_TABLE = dict.fromkeys(c for c in range(32) if chr(c) not in '\n\r\t')
+
+# Parsed rows are shown in the UI this many at a time while a scrape is processed
+DISPLAY_BATCH_SIZE = 120
+
+# Rows sent to the browser per page of the product table
+TABLE_PAGE_SIZE = 100
+
+# Low-cardinality text columns stored as categoricals - smaller in session state and faster to filter
+CATEGORY_COLUMNS = ('Vendor', 'Product Type', 'Collection')
+
+# CSS selector fallbacks for product tab titles and content, in priority order
+TAB_TITLE_SELECTORS = ('.product-tab__title', 'button[data-collapsible-trigger]', 'button')
+TAB_CONTENT_SELECTORS = ('.product-tab__inner', '.product-tab__content')
+
+@functools.lru_cache(maxsize=128)
+def normalize_store_url(url):
+    """Add a missing https:// scheme and strip trailing slashes from a store URL"""
+    if not url.startswith(('http://', 'https://')):
+        url = 'https://' + url
+    return url.rstrip('/')
+
+def has_shopify_headers(headers):
+    """Check response headers for Shopify's store fingerprint"""
+    return (
+        any(header in headers for header in SHOPIFY_HEADERS)
+        or 'shopify' in headers.get('powered-by', '').lower()
+    )
+
+@st.cache_data(ttl=600, show_spinner=False)
+def detect_shopify_store(url):
+    """Check if a URL is a Shopify store, raising when the store can't be reached so failures aren't cached"""
+    try:
+        # Shopify identifies itself in response headers, so a body-less HEAD request is usually enough
+        response = SESSION.head(normalize_store_url(url), timeout=5, allow_redirects=True)
+        if has_shopify_headers(response.headers):
+            return True
+    except requests.exceptions.RequestException:
+        pass
+    
+    # The fingerprint sits in the <head>, so only the start of the page is downloaded
+    with SESSION.get(normalize_store_url(url), stream=True, timeout=10) as response:
+        page_start = response.raw.read(HOMEPAGE_SNIFF_BYTES, decode_content=True)
+    return SHOPIFY_MARKER_RE.search(page_start) is not None
+
 def is_shopify_store(url):
     """Check if a URL is a Shopify store"""
     try:
-        response = requests.get(url, timeout=10)
-        return 'shopify' in response.text.lower() or 'cdn.shopify.com' in response.text
-    except:
+        return detect_shopify_store(url)
+    except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError):
         return False
 
-def get_products_json(store_url, limit=250):
-    """Get products from Shopify's products.json endpoint with pagination"""
+def decode_json_response(response):
+    """Decode a JSON response body with orjson, falling back to the stdlib parser for input orjson rejects"""
     try:
-        # Clean and format the URL
-        if not store_url.startswith(('http://', 'https://')):
-            store_url = 'https://' + store_url
-        
-        base_url = store_url.rstrip('/')
-        all_products = []
-        page = 1
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
+        return orjson.loads(response.content)
+    except orjson.JSONDecodeError:
+        # orjson refuses lone surrogate escapes (descriptions cut mid-emoji) and BOM-prefixed bodies
+        return response.json()
+
+def fetch_products_page(base_url, limit, page):
+    """Fetch a single page from the products.json endpoint"""
+    products_url = f"{base_url}/products.json?limit={limit}&page={page}"
+    
+    response = SESSION.get(products_url, timeout=15)
+    response.raise_for_status()
+    
+    data = decode_json_response(response)
+    return data.get('products', [])
+
+@st.cache_data(ttl=1800, show_spinner=False, max_entries=32)
+def fetch_all_products(store_url, limit):
+    """Fetch every products.json page of a store, raising on failure so errors aren't cached"""
+    # Clean and format the URL
+    base_url = normalize_store_url(store_url)
+    
+    # Probe the first page - if it isn't full there is nothing left to paginate
+    all_products = fetch_products_page(base_url, limit, 1)
+    if len(all_products) < limit:
+        return all_products
+    
+    # Fetch the remaining pages concurrently, a batch at a time, until a short page shows up
+    next_page = 2
+    while next_page <= MAX_PRODUCT_PAGES:
+        batch = range(next_page, min(next_page + PAGE_FETCH_CONCURRENCY, MAX_PRODUCT_PAGES + 1))
+        pages = HTTP_EXECUTOR.map(lambda page: fetch_products_page(base_url, limit, page), batch)
         
-        while True:
-            # Try pagination with limit and page parameters
-            products_url = f"{base_url}/products.json?limit={limit}&page={page}"
-            
-            response = requests.get(products_url, headers=headers, timeout=15)
-            response.raise_for_status()
-            
-            data = response.json()
-            products = data.get('products', [])
-            
-            if not products:  # No more products
-                break
-                
+        for products in pages:
             all_products.extend(products)
             
             # If we got fewer products than the limit, we're done
             if len(products) < limit:
-                break
-                
-            page += 1
-            time.sleep(0.5)  # Be respectful with pagination
-            
-            # Safety check to prevent infinite loops
-            if page > 50:  # Max 50 pages
-                st.warning("Reached maximum pagination limit (50 pages)")
-                break
+                return all_products
         
-        return all_products
+        next_page += len(batch)
     
+    # Safety check to prevent infinite loops
+    st.warning(f"Reached maximum pagination limit ({MAX_PRODUCT_PAGES} pages)")
+    return all_products
+
+def get_products_json(store_url, limit=250):
+    """Get products from Shopify's products.json endpoint with pagination"""
+    try:
+        return fetch_all_products(store_url, limit)
     except requests.exceptions.RequestException as e:
         st.error(f"Network error: {str(e)}")
         return None
@@ -92,67 +238,104 @@ def get_products_json(store_url, limit=250):
         st.error(f"Error fetching products: {str(e)}")
         return None
 
-def get_collections_and_products(store_url):
-    """Get products by scraping through collections"""
+def fetch_collection_products(base_url, collection):
+    """Fetch the products of a single collection, returning (title, products, or None if the fetch failed)"""
+    collection_handle = collection.get('handle')
+    collection_title = collection.get('title', collection_handle)
+    collection_url = f"{base_url}/collections/{collection_handle}/products.json"
+    
     try:
-        if not store_url.startswith(('http://', 'https://')):
-            store_url = 'https://' + store_url
-        
-        base_url = store_url.rstrip('/')
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        
-        # First, try to get collections
-        collections_url = f"{base_url}/collections.json"
-        response = requests.get(collections_url, headers=headers, timeout=15)
-        
+        response = SESSION.get(collection_url, timeout=10)
         if response.status_code == 200:
-            collections_data = response.json()
-            collections = collections_data.get('collections', [])
-            
-            all_products = []
-            collection_products = {}
+            return collection_title, decode_json_response(response).get('products', [])
+        if response.status_code not in RETRYABLE_STATUSES:
+            # Hidden or removed collection - a stable answer, not a failure
+            return collection_title, []
+    except (requests.exceptions.RequestException, ValueError):
+        pass
+    
+    return collection_title, None
+
+@st.cache_data(ttl=1800, show_spinner=False, max_entries=32)
+def fetch_collections_and_products(store_url):
+    """Fetch products through every collection, raising on failure so errors and partial results aren't cached"""
+    base_url = normalize_store_url(store_url)
+    
+    # First, try to get collections
+    collections_url = f"{base_url}/collections.json"
+    response = SESSION.get(collections_url, timeout=15)
+    
+    if response.status_code != 200:
+        if response.status_code in RETRYABLE_STATUSES:
+            response.raise_for_status()
+        return [], {}
+    
+    collections_data = decode_json_response(response)
+    collections = collections_data.get('collections', [])
+    
+    all_products = []
+    collection_products = Counter()  # Products per collection title, counted as each response lands
+    failed_collections = 0
+    
+    # Get products from the collections concurrently, a window at a time like pagination does, so a store
+    # with hundreds of collections can't flood the shared pool; results come back in collection order
+    collections = [collection for collection in collections if collection.get('handle')]
+    for start in range(0, len(collections), PAGE_FETCH_CONCURRENCY):
+        window = collections[start:start + PAGE_FETCH_CONCURRENCY]
+        results = HTTP_EXECUTOR.map(lambda collection: fetch_collection_products(base_url, collection), window)
+        
+        for collection_title, products in results:
+            if products is None:
+                failed_collections += 1
+                continue
             
-            for collection in collections:
-                collection_handle = collection.get('handle')
-                if collection_handle:
-                    # Get products from each collection
-                    collection_url = f"{base_url}/collections/{collection_handle}/products.json"
-                    
-                    try:
-                        coll_response = requests.get(collection_url, headers=headers, timeout=10)
-                        if coll_response.status_code == 200:
-                            coll_data = coll_response.json()
-                            products = coll_data.get('products', [])
-                            collection_products[collection.get('title', collection_handle)] = len(products)
-                            
-                            # Add collection info to products
-                            for product in products:
-                                product['collection'] = collection.get('title', collection_handle)
-                            
-                            all_products.extend(products)
-                            time.sleep(0.3)  # Be respectful
-                    except:
-                        continue
+            collection_products[collection_title] += len(products)
             
-            # Remove duplicates based on product ID
-            seen_ids = set()
-            unique_products = []
-            for product in all_products:
-                product_id = product.get('id')
-                if product_id not in seen_ids:
-                    seen_ids.add(product_id)
-                    unique_products.append(product)
+            # Add collection info to products
+            for product in products:
+                product['collection'] = collection_title
             
-            return unique_products, collection_products
-        
-        return [], {}
+            all_products.extend(products)
+    
+    # Remove duplicates based on product ID, keeping the first collection a product was seen in
+    unique_products = {}
+    for product in all_products:
+        unique_products.setdefault(product.get('id'), product)
     
+    result = list(unique_products.values()), collection_products
+    if failed_collections:
+        raise IncompleteScrapeError(f"{failed_collections} collection(s) could not be fetched - results are partial", result)
+    return result
+
+def get_collections_and_products(store_url):
+    """Get products by scraping through collections"""
+    try:
+        return fetch_collections_and_products(store_url)
+    except IncompleteScrapeError as e:
+        st.warning(f"⚠️ {e}")
+        return e.result
     except Exception as e:
         st.error(f"Error fetching collections: {str(e)}")
         return [], {}
 
+def submit_with_script_context(executor, function, *args):
+    """Submit a call to an executor so it can still write Streamlit elements from the worker thread"""
+    ctx = get_script_run_ctx()
+    
+    def run():
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return function(*args)
+    
+    return executor.submit(run)
+
+def add_new_products(all_products, products, seen_ids):
+    """Append products whose ID isn't in seen_ids yet, updating seen_ids in place"""
+    for product in products:
+        product_id = product.get('id')
+        if product_id not in seen_ids:
+            seen_ids.add(product_id)
+            all_products.append(product)
+
 def clean_text_for_dataframe(text):
     """Clean text to prevent Unicode encoding errors in dataframes"""
     if not text:
@@ -161,14 +344,15 @@ def clean_text_for_dataframe(text):
     # Convert to string if not already
     text = str(text)
     
-    # Remove or replace problematic Unicode characters
-    text = text.encode('utf-8', errors='ignore').decode('utf-8')
+    # Remove or replace problematic Unicode characters (plain ASCII can't contain any)
+    if not text.isascii():
+        text = text.encode('utf-8', errors='ignore').decode('utf-8')
     
     # Remove control characters
-    text = ''.join(char for char in text if ord(char) >= 32 or char in '\n\r\t')
+    text = text.translate(CONTROL_CHARS_TABLE)
     
     # Normalize whitespace
-    text = re.sub(r'\s+', ' ', text).strip()
+    text = WHITESPACE_RE.sub(' ', text).strip()
     
     # Limit length to prevent huge cells
     if len(text) > 2000:
@@ -176,26 +360,43 @@ def clean_text_for_dataframe(text):
     
     return text
 
-def get_detailed_product_info(store_url, product_handle, delay=1.0):
-    """Get detailed product information by scraping the individual product page"""
+def html_to_text(body_html):
+    """Strip tags from product body HTML and return it as cleaned plain text"""
+    if not body_html:
+        return ""
+    
+    # Tags become spaces so text in adjacent block elements doesn't run together
+    return clean_text_for_dataframe(html.unescape(HTML_TAG_RE.sub(' ', body_html)))
+
+def select_first(element, selectors):
+    """Return the first element matched by a list of CSS selectors tried in order"""
+    for selector in selectors:
+        match = element.select_one(selector)
+        if match:
+            return match
+    return None
+
+def fetch_product_page(store_url, product_handle, delay=1.0):
+    """Fetch an individual product page, returning (product_url, response or the raised exception)"""
+    base_url = normalize_store_url(store_url)
+    product_url = f"{base_url}/products/{product_handle}"
+    
     try:
-        if not store_url.startswith(('http://', 'https://')):
-            store_url = 'https://' + store_url
-        
-        base_url = store_url.rstrip('/')
-        product_url = f"{base_url}/products/{product_handle}"
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        
         time.sleep(delay)  # Respect rate limiting
-        response = requests.get(product_url, headers=headers, timeout=15)
+        return product_url, SESSION.get(product_url, timeout=15)
+    except Exception as e:
+        return product_url, e
+
+def parse_detailed_product_page(product_url, response):
+    """Extract tabbed and collapsible product content from a fetched product page"""
+    try:
+        if isinstance(response, Exception):
+            raise response
         
         if response.status_code != 200:
             return {'Debug_Error': f'HTTP {response.status_code} for {product_url}'}
         
-        soup = BeautifulSoup(response.content, 'html.parser')
+        soup = BeautifulSoup(response.content, 'lxml')
         detailed_info = {'Debug_URL': clean_text_for_dataframe(product_url)}  # Always include URL for debugging
         
         # Debug: Check if we can find any product-tabs at all
@@ -209,19 +410,9 @@ def get_detailed_product_info(store_url, product_handle, delay=1.0):
             
             if product_tabs:
                 for i, tab in enumerate(product_tabs):
-                    # Get tab title - try multiple selectors
-                    title_elem = tab.select_one('.product-tab__title')
-                    if not title_elem:
-                        title_elem = tab.select_one('button[data-collapsible-trigger]')
-                    if not title_elem:
-                        title_elem = tab.select_one('button')
-                    
-                    # Get content - try multiple selectors
-                    content_elem = tab.select_one('.product-tab__content .product-tab__inner')
-                    if not content_elem:
-                        content_elem = tab.select_one('.product-tab__inner')
-                    if not content_elem:
-                        content_elem = tab.select_one('.product-tab__content')
+                    # Get tab title and content - try selectors in priority order
+                    title_elem = select_first(tab, TAB_TITLE_SELECTORS)
+                    content_elem = select_first(tab, TAB_CONTENT_SELECTORS)
                     
                     if title_elem:
                         title = clean_text_for_dataframe(title_elem.get_text(strip=True))
@@ -233,7 +424,7 @@ def get_detailed_product_info(store_url, product_handle, delay=1.0):
                             
                             if title and content and len(content) > 5:
                                 # Clean title for column name
-                                clean_title = re.sub(r'[^a-zA-Z0-9\s]', '', title).strip().replace(' ', '_')
+                                clean_title = NON_ALPHANUMERIC_RE.sub('', title).strip().replace(' ', '_')
                                 detailed_info[f'Tab_{clean_title}'] = content
                         else:
                             detailed_info[f'Debug_Tab_{i}_Content'] = 'No content found'
@@ -263,7 +454,7 @@ def get_detailed_product_info(store_url, product_handle, delay=1.0):
                     content = clean_text_for_dataframe(content_elem.get_text(strip=True))
                     
                     if title and content and len(content) > 10:
-                        clean_title = re.sub(r'[^a-zA-Z0-9\s]', '', title).strip().replace(' ', '_')
+                        clean_title = NON_ALPHANUMERIC_RE.sub('', title).strip().replace(' ', '_')
                         detailed_info[f'Collapsible_{clean_title}'] = content
         
         # Look for any elements with common tab-related classes
@@ -295,95 +486,200 @@ def get_detailed_product_info(store_url, product_handle, delay=1.0):
     except Exception as e:
         return {'Debug_Exception': f'Error: {clean_text_for_dataframe(str(e))}'}
 
+def parse_product(product):
+    """Parse a single Shopify product into a flat row for the dataframe"""
+    variants = product.get('variants') or ()
+    images = product.get('images') or ()
+    tags = product.get('tags') or ()
+    body_html = product.get('body_html')
+    
+    # Get first variant for pricing (most Shopify stores have at least one variant)
+    first_variant = variants[0] if variants else {}
+    
+    # Get all images
+    first_image = images[0].get('src', '') if images else ''
+    
+    # Create list of all image URLs (excluding the main image to avoid duplication)
+    all_image_urls = [img.get('src', '') for img in images if img.get('src')]
+    additional_images = all_image_urls[1:] if len(all_image_urls) > 1 else []  # Skip first image
+    
+    # Get variant images (images specific to variants) with better handling
+    variant_images = []
+    variant_image_details = []
+    
+    # Map image IDs to their image once so each variant's image is a single lookup
+    image_mapping = {
+        img['id']: ProductImage(img.get('src', ''), img.get('alt', ''), img.get('position', 0))
+        for img in images if img.get('id') is not None
+    }
+    
+    for variant in variants:
+        variant_image_id = variant.get('image_id')
+        if variant_image_id:
+            # Find the image that matches this variant
+            variant_img = image_mapping.get(variant_image_id)
+            if variant_img and variant_img.src:
+                variant_info = {
+                    'variant_title': variant.get('title', 'Default'),
+                    'variant_sku': variant.get('sku', ''),
+                    'variant_price': variant.get('price', ''),
+                    'image_url': variant_img.src,
+                    'image_alt': variant_img.alt,
+                    'image_position': variant_img.position
+                }
+                variant_image_details.append(variant_info)
+                
+                # Also add to simple list for display
+                if variant_img.src not in variant_images:
+                    variant_images.append(variant_img.src)
+    
+    # Create formatted variant info for display
+    variant_display = []
+    for var_info in variant_image_details:
+        display_text = f"{var_info['variant_title']}: {var_info['image_url']}"
+        if var_info['variant_sku']:
+            display_text += f" (SKU: {var_info['variant_sku']})"
+        variant_display.append(display_text)
+    
+    parsed_product = {
+        'Title': product.get('title', ''),
+        'Handle': product.get('handle', ''),
+        'Product Type': product.get('product_type', ''),
+        'Vendor': product.get('vendor', ''),
+        'Collection': product.get('collection', ''),  # Add collection info
+        'Price': first_variant.get('price', '0'),
+        'Compare At Price': first_variant.get('compare_at_price', ''),
+        'Available': first_variant.get('available', False),
+        'Inventory Quantity': first_variant.get('inventory_quantity', 0),
+        'Weight': first_variant.get('weight', 0),
+        'Tags': ', '.join(tags),
+        'Created At': product.get('created_at', ''),
+        'Updated At': product.get('updated_at', ''),
+        'Published At': product.get('published_at', ''),
+        'Main Image': first_image,
+        'Additional Images': ' | '.join(additional_images) if additional_images else '',
+        'Variant Images': ' | '.join(variant_images) if variant_images else '',
+        'Variant Details': ' | '.join(variant_display) if variant_display else '',
+        'Total Images': len(all_image_urls),
+        'Variants Count': len(variants),
+        'Description': html_to_text(body_html)
+    }
+    
+    return parsed_product
+
+def add_detailed_info(parsed_product, detailed_info):
+    """Merge a (pending) detailed product page scrape into a parsed product row"""
+    if detailed_info is None:
+        return parsed_product
+    
+    # Add detailed information to the product data with proper text cleaning
+    for key, value in detailed_info.result().items():
+        clean_key = clean_text_for_dataframe(str(key))
+        clean_value = clean_text_for_dataframe(str(value))
+        if clean_key and clean_value:
+            parsed_product[f'Detail_{clean_key}'] = clean_value
+    
+    return parsed_product
+
 def parse_product_data(products, fetch_detailed=False, store_url='', delay=1.0):
-    """Parse product data into a structured format with optional detailed scraping"""
-    parsed_products = []
-    
-    for i, product in enumerate(products):
-        # Get first variant for pricing (most Shopify stores have at least one variant)
-        first_variant = product.get('variants', [{}])[0]
-        
-        # Get all images
-        images = product.get('images', [])
-        first_image = images[0].get('src', '') if images else ''
-        
-        # Create list of all image URLs (excluding the main image to avoid duplication)
-        all_image_urls = [img.get('src', '') for img in images if img.get('src')]
-        additional_images = all_image_urls[1:] if len(all_image_urls) > 1 else []  # Skip first image
-        
-        # Get variant images (images specific to variants) with better handling
-        variant_images = []
-        variant_image_details = []
-        
-        for variant in product.get('variants', []):
-            variant_image_id = variant.get('image_id')
-            if variant_image_id:
-                # Find the image that matches this variant
-                variant_img = next((img for img in images if img.get('id') == variant_image_id), None)
-                if variant_img and variant_img.get('src'):
-                    variant_info = {
-                        'variant_title': variant.get('title', 'Default'),
-                        'variant_sku': variant.get('sku', ''),
-                        'variant_price': variant.get('price', ''),
-                        'image_url': variant_img.get('src', ''),
-                        'image_alt': variant_img.get('alt', ''),
-                        'image_position': variant_img.get('position', 0)
-                    }
-                    variant_image_details.append(variant_info)
-                    
-                    # Also add to simple list for display
-                    if variant_img.get('src') not in variant_images:
-                        variant_images.append(variant_img.get('src'))
-        
-        # Create formatted variant info for display
-        variant_display = []
-        for var_info in variant_image_details:
-            display_text = f"{var_info['variant_title']}: {var_info['image_url']}"
-            if var_info['variant_sku']:
-                display_text += f" (SKU: {var_info['variant_sku']})"
-            variant_display.append(display_text)
-        
-        parsed_product = {
-            'Title': product.get('title', ''),
-            'Handle': product.get('handle', ''),
-            'Product Type': product.get('product_type', ''),
-            'Vendor': product.get('vendor', ''),
-            'Collection': product.get('collection', ''),  # Add collection info
-            'Price': first_variant.get('price', '0'),
-            'Compare At Price': first_variant.get('compare_at_price', ''),
-            'Available': first_variant.get('available', False),
-            'Inventory Quantity': first_variant.get('inventory_quantity', 0),
-            'Weight': first_variant.get('weight', 0),
-            'Tags': ', '.join(product.get('tags', [])),
-            'Created At': product.get('created_at', ''),
-            'Updated At': product.get('updated_at', ''),
-            'Published At': product.get('published_at', ''),
-            'Main Image': first_image,
-            'Additional Images': ' | '.join(additional_images) if additional_images else '',
-            'Variant Images': ' | '.join(variant_images) if variant_images else '',
-            'Variant Details': ' | '.join(variant_display) if variant_display else '',
-            'Total Images': len(all_image_urls),
-            'Variants Count': len(product.get('variants', [])),
-            'Description': clean_text_for_dataframe(BeautifulSoup(product.get('body_html', ''), 'html.parser').get_text().strip()) if product.get('body_html') else ''
-        }
-        
-        # Fetch detailed information if requested
-        if fetch_detailed and product.get('handle') and store_url:
-            if (i + 1) % 5 == 0:  # Progress update every 5 products
-                st.write(f"Fetching detailed info for product {i + 1}/{len(products)}...")
+    """Parse product data into structured rows, yielded one at a time, with optional detailed scraping"""
+    if not (fetch_detailed and store_url):
+        for product in products:
+            yield parse_product(product)
+        return
+    
+    # Product pages are fetched one at a time (rate limited) while a worker thread parses
+    # the previous page, so HTML parsing overlaps the delay instead of adding to it.
+    # Rows are yielded one product behind, once their page has had a full delay to parse
+    pending = None
+    with ThreadPoolExecutor(max_workers=1) as parse_executor:
+        for i, product in enumerate(products):
+            parsed_product = parse_product(product)
+            detailed_info = None
             
-            detailed_info = get_detailed_product_info(store_url, product.get('handle'), delay)
+            if product.get('handle'):
+                if (i + 1) % 5 == 0:  # Progress update every 5 products
+                    st.write(f"Fetching detailed info for product {i + 1}/{len(products)}...")
+                
+                product_page = fetch_product_page(store_url, product.get('handle'), delay)
+                detailed_info = parse_executor.submit(parse_detailed_product_page, *product_page)
             
-            # Add detailed information to the product data with proper text cleaning
-            for key, value in detailed_info.items():
-                clean_key = clean_text_for_dataframe(str(key))
-                clean_value = clean_text_for_dataframe(str(value))
-                if clean_key and clean_value:
-                    parsed_product[f'Detail_{clean_key}'] = clean_value
+            if pending:
+                yield add_detailed_info(*pending)
+            pending = (parsed_product, detailed_info)
         
-        parsed_products.append(parsed_product)
+        if pending:
+            yield add_detailed_info(*pending)
+
+def append_row_to_columns(columns, row, row_count):
+    """Append a parsed row to per-column value lists, padding with None where the row or earlier rows lack a column"""
+    for key, value in row.items():
+        column = columns.get(key)
+        if column is None:
+            # First row with this column (e.g. a new Detail_ field) - backfill the earlier rows
+            column = columns[key] = [None] * row_count
+        column.append(value)
     
-    return parsed_products
+    if len(row) < len(columns):
+        for column in columns.values():
+            if len(column) == row_count:
+                column.append(None)
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def dataframe_to_csv(df):
+    """Serialize a dataframe to CSV bytes, cached so reruns don't re-serialize unchanged data"""
+    # Write encoded bytes straight into a buffer rather than building the whole CSV str and encoding a copy
+    # (pandas rather than pyarrow's writer, which would change quoting and boolean spelling in the file)
+    buffer = io.BytesIO()
+    df.to_csv(buffer, index=False, encoding='utf-8')
+    return buffer.getvalue()
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def dataframe_to_csv_gzip(df):
+    """Serialize a dataframe to gzip-compressed CSV bytes, cached so reruns don't recompress unchanged data"""
+    # Level 1 keeps compression cheap - product CSVs are repetitive enough to shrink well regardless
+    return gzip.compress(dataframe_to_csv(df), compresslevel=1)
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def dataframe_to_json(df):
+    """Serialize a dataframe to JSON records bytes, cached so reruns don't re-serialize unchanged data"""
+    return df.to_json(orient='records', indent=2).encode('utf-8')
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def dataframe_to_excel(df):
+    """Serialize a dataframe to .xlsx workbook bytes, cached so reruns don't rebuild the workbook"""
+    buffer = io.BytesIO()
+    # Image URL columns stay plain text - hyperlink conversion is slow and capped per worksheet
+    with pd.ExcelWriter(buffer, engine='xlsxwriter', engine_kwargs={'options': {'strings_to_urls': False}}) as writer:
+        df.to_excel(writer, index=False, sheet_name='Products')
+    return buffer.getvalue()
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def sorted_unique_values(values):
+    """Get the sorted distinct non-empty values of a column, cached for filter options across reruns"""
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # A categorical column already holds its distinct values as categories
+        values = pd.Series(values.cat.categories)
+    values = values.dropna()
+    return np.sort(values[values.ne('')].unique()).tolist()
+
+# Export format -> (serializer, file extension, MIME type) for the download button
+EXPORT_FORMATS = {
+    "CSV": (dataframe_to_csv, "csv", "text/csv"),
+    "CSV (gzip)": (dataframe_to_csv_gzip, "csv.gz", "application/gzip"),
+    "JSON": (dataframe_to_json, "json", "application/json"),
+    "Excel": (dataframe_to_excel, "xlsx", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+}
+
+def render_download(df, export_format, timestamp):
+    """Render the download button for a dataframe in the chosen export format"""
+    serializer, extension, mime = EXPORT_FORMATS[export_format]
+    st.download_button(
+        label=f"📄 Download {export_format}",
+        data=serializer(df),
+        file_name=f"shopify_products_{timestamp}.{extension}",
+        mime=mime
+    )
 
 def main():
     # Header
@@ -427,7 +723,7 @@ def main():
         
         # Export options
         st.header("📊 Export Options")
-        export_format = st.selectbox("Export Format", ["CSV", "JSON", "Excel"])
+        export_format = st.selectbox("Export Format", list(EXPORT_FORMATS))
     
     # Main input section
     col1, col2 = st.columns([3, 1])
@@ -443,6 +739,7 @@ def main():
         st.write("")  # Add some spacing
         st.write("")  # Add some spacing
         scrape_button = st.button("🔍 Scrape Products", type="primary")
+        refresh_button = st.button("🔄 Refresh", help="Discard cached store data and scrape again")
     
     # Scraping method selection
     st.subheader("🔧 Scraping Method")
@@ -479,9 +776,18 @@ def main():
         **Note:** Different methods may return different amounts of data. Some stores restrict access to certain endpoints.
         """)
     
+    if refresh_button:
+        # Store responses are cached across reruns - drop this store's entries (keyed by the exact
+        # arguments the fetchers are called with) so this scrape hits it again, leaving other stores cached
+        detect_shopify_store.clear(store_url)
+        for limit in (50, 250):
+            fetch_all_products.clear(store_url, limit)
+        fetch_collections_and_products.clear(store_url)
+    
     # Scraping logic
-    if scrape_button and store_url:
+    if (scrape_button or refresh_button) and store_url:
         all_products = []
+        seen_ids = set()  # Product IDs already in all_products, maintained incrementally
         collection_info = {}
         
         with st.spinner("Scraping products... Please wait"):
@@ -515,68 +821,113 @@ def main():
                     status.update(label=f"Collections method: {len(all_products)} products from {len(collection_info)} collections ✅", state="complete")
                     
             elif scraping_method == "All Methods Combined":
-                # Method 1: Standard JSON
-                with st.status("Method 1: Standard JSON API...", expanded=True) as status:
-                    products1 = get_products_json(store_url, limit=50)
-                    if products1:
-                        all_products.extend(products1)
-                    status.update(label=f"Standard API: {len(products1) if products1 else 0} products ✅", state="complete")
-                
-                # Method 2: Paginated JSON
-                with st.status("Method 2: Paginated JSON API...", expanded=True) as status:
-                    products2 = get_products_json(store_url, limit=250)
+                # Start the paginated and collections scrapes at once - they hit independent endpoints, so their requests overlap
+                with ThreadPoolExecutor(max_workers=2) as method_executor:
+                    paginated_scrape = submit_with_script_context(method_executor, get_products_json, store_url, 250)
+                    collections_scrape = submit_with_script_context(method_executor, get_collections_and_products, store_url)
+                    
+                    # One progress bar tracks every method instead of a status block per method
+                    progress = st.progress(0.0, text="Method 2: Paginated JSON API...")
+                    method_summaries = []
+                    
+                    # Method 2: Paginated JSON
+                    products2 = paginated_scrape.result()
                     if products2:
-                        # Add any new products not already found
-                        existing_ids = {p.get('id') for p in all_products}
-                        new_products = [p for p in products2 if p.get('id') not in existing_ids]
-                        all_products.extend(new_products)
-                    status.update(label=f"Paginated API: {len(products2) if products2 else 0} products ✅", state="complete")
-                
-                # Method 3: Collections
-                with st.status("Method 3: Collections-based scraping...", expanded=True) as status:
-                    products3, collections = get_collections_and_products(store_url)
+                        add_new_products(all_products, products2, seen_ids)
+                    method_summaries.append(f"Paginated API: {len(products2) if products2 else 0} products")
+                    progress.progress(1 / 3, text=f"{method_summaries[-1]} - Method 1: Standard JSON API...")
+                    
+                    # Method 1: Standard JSON - walks the same /products.json catalog as Method 2 in 5x
+                    # smaller pages, so it only runs when the paginated walk comes back empty
+                    if products2:
+                        method_summaries.insert(0, "Standard API: skipped, covered by the paginated API")
+                    else:
+                        products1 = get_products_json(store_url, limit=50)
+                        if products1:
+                            add_new_products(all_products, products1, seen_ids)
+                        method_summaries.insert(0, f"Standard API: {len(products1) if products1 else 0} products")
+                    progress.progress(2 / 3, text=f"{method_summaries[0]} - Method 3: Collections-based scraping...")
+                    
+                    # Method 3: Collections
+                    products3, collections = collections_scrape.result()
                     if products3:
                         # Add any new products not already found
-                        existing_ids = {p.get('id') for p in all_products}
-                        new_products = [p for p in products3 if p.get('id') not in existing_ids]
-                        all_products.extend(new_products)
+                        add_new_products(all_products, products3, seen_ids)
                         collection_info = collections
-                    status.update(label=f"Collections: {len(products3) if products3 else 0} products from {len(collection_info)} collections ✅", state="complete")
+                    method_summaries.append(f"Collections: {len(products3) if products3 else 0} products from {len(collection_info)} collections")
+                    progress.progress(1.0, text=" · ".join(method_summaries) + " ✅")
             
             if not all_products:
+                st.session_state.pop('scrape_results', None)
                 st.warning("No products found. The store might be empty or have restricted access.")
                 st.stop()
         
         # Parse and display data
         with st.status("Processing product data...", expanded=True) as status:
-            parsed_products = parse_product_data(all_products, fetch_detailed, store_url, detailed_delay)
-            df = pd.DataFrame(parsed_products)
+            # Show rows as they are parsed (detailed scraping can take minutes) and build the
+            # final dataframe from the accumulated batches
+            progress_text = st.empty()
+            preview = st.empty()
+            columns = {}
+            parsed_count = 0
+            
+            rows = parse_product_data(all_products, fetch_detailed, store_url, detailed_delay)
+            while True:
+                batch = list(itertools.islice(rows, DISPLAY_BATCH_SIZE))
+                if not batch:
+                    break
+                
+                for row in batch:
+                    append_row_to_columns(columns, row, parsed_count)
+                    parsed_count += 1
+                progress_text.write(f"Parsed {parsed_count}/{len(all_products)} products...")
+                preview.dataframe(pd.DataFrame.from_records(batch), use_container_width=True)
+            
+            df = pd.DataFrame(columns).astype(dict.fromkeys(CATEGORY_COLUMNS, 'category'))
+            progress_text.empty()
+            preview.empty()
             status.update(label="Data processing complete ✅", state="complete")
         
+        # Keep the results for later reruns (filters, paging, downloads) so they don't re-scrape
+        st.session_state['scrape_results'] = {
+            'store_url': store_url,
+            'df': df,
+            'collection_info': collection_info,
+            'scraped_at': int(time.time())  # Fixed per scrape so download file names don't change on every rerun
+        }
+    
+    results = st.session_state.get('scrape_results')
+    if results and results['store_url'] == store_url:
+        df = results['df']
+        collection_info = results['collection_info']
+        
         # Display results
-        st.success(f"✅ Successfully scraped {len(parsed_products)} products!")
+        st.success(f"✅ Successfully scraped {len(df)} products!")
         
         # Show collection information if available
         if collection_info:
             st.info(f"📂 Found products across {len(collection_info)} collections:")
-            cols = st.columns(min(4, len(collection_info)))
-            for i, (collection_name, count) in enumerate(collection_info.items()):
-                with cols[i % len(cols)]:
-                    st.metric(collection_name, f"{count} products")
+            # One table instead of a metric widget per collection - stores can have hundreds
+            st.dataframe(
+                pd.DataFrame(collection_info.items(), columns=['Collection', 'Products']),
+                use_container_width=True,
+                hide_index=True
+            )
         
         # Metrics
         col1, col2, col3, col4 = st.columns(4)
         with col1:
-            st.metric("Total Products", len(parsed_products))
+            st.metric("Total Products", len(df))
         with col2:
-            available_products = sum(1 for p in parsed_products if p['Available'])
+            available_products = int(df['Available'].eq(True).sum())
             st.metric("Available Products", available_products)
         with col3:
-            unique_vendors = len(set(p['Vendor'] for p in parsed_products if p['Vendor']))
+            unique_vendors = df.loc[df['Vendor'].ne(''), 'Vendor'].nunique()
             st.metric("Unique Vendors", unique_vendors)
         with col4:
-            prices = [float(p['Price']) for p in parsed_products if p['Price'] and str(p['Price']).replace('.', '').isdigit()]
-            avg_price = sum(prices) / len(prices) if prices else 0
+            avg_price = pd.to_numeric(df['Price'], errors='coerce').mean()
+            if pd.isna(avg_price):
+                avg_price = 0
             st.metric("Average Price", f"${avg_price:.2f}")
         
         # Data table
@@ -587,26 +938,39 @@ def main():
         with col1:
             vendor_filter = st.multiselect(
                 "Filter by Vendor:",
-                options=sorted(list(set(p['Vendor'] for p in parsed_products if p['Vendor']))),
+                options=sorted_unique_values(df['Vendor']),
                 default=[]
             )
         with col2:
             product_type_filter = st.multiselect(
                 "Filter by Product Type:",
-                options=sorted(list(set(p['Product Type'] for p in parsed_products if p['Product Type']))),
+                options=sorted_unique_values(df['Product Type']),
                 default=[]
             )
         
-        # Apply filters
-        filtered_df = df.copy()
-        if vendor_filter:
-            filtered_df = filtered_df[filtered_df['Vendor'].isin(vendor_filter)]
-        if product_type_filter:
-            filtered_df = filtered_df[filtered_df['Product Type'].isin(product_type_filter)]
+        # Apply filters as a single combined mask and one selection (no upfront copy)
+        if vendor_filter or product_type_filter:
+            mask = np.ones(len(df), dtype=bool)
+            if vendor_filter:
+                mask &= df['Vendor'].isin(np.asarray(vendor_filter, dtype=object)).to_numpy()
+            if product_type_filter:
+                mask &= df['Product Type'].isin(np.asarray(product_type_filter, dtype=object)).to_numpy()
+            filtered_df = df.loc[mask]
+        else:
+            # Nothing to filter - reuse the scraped frame as is
+            filtered_df = df
+        
+        # Send one page of rows to the browser at a time so large catalogs stay light to render
+        page_count = max(1, -(-len(filtered_df) // TABLE_PAGE_SIZE))
+        page = 1
+        if page_count > 1:
+            page = st.number_input("Page", min_value=1, max_value=page_count, value=1, step=1)
+        page_start = (page - 1) * TABLE_PAGE_SIZE
+        page_df = filtered_df.iloc[page_start:page_start + TABLE_PAGE_SIZE]
         
         # Display filtered data with improved column settings
         st.dataframe(
-            filtered_df, 
+            page_df, 
             use_container_width=True,
             column_config={
                 "Description": st.column_config.TextColumn(
@@ -636,21 +1000,24 @@ def main():
                 )
             }
         )
+        if len(filtered_df) > 0:
+            st.caption(f"Showing rows {page_start + 1}-{page_start + len(page_df)} of {len(filtered_df)}")
         
         # Image gallery section
         if len(filtered_df) > 0:
             st.subheader("🖼️ Product Image Gallery")
             
-            # Select product for image viewing
+            # Select product for image viewing - options are row positions so the pick is a direct lookup
             product_titles = filtered_df['Title'].tolist()
-            selected_product = st.selectbox(
+            selected_position = st.selectbox(
                 "Select a product to view all images:",
-                options=product_titles,
+                options=range(len(product_titles)),
+                format_func=product_titles.__getitem__,
                 help="Choose a product to see all its images"
             )
             
-            if selected_product:
-                product_row = filtered_df[filtered_df['Title'] == selected_product].iloc[0]
+            if selected_position is not None:
+                product_row = filtered_df.iloc[selected_position]
                 main_image = product_row['Main Image']
                 additional_images = product_row['Additional Images']
                 variant_images = product_row['Variant Images']
@@ -707,32 +1074,7 @@ def main():
         
         # Download section
         st.subheader("💾 Download Data")
-        
-        if export_format == "CSV":
-            csv_data = filtered_df.to_csv(index=False)
-            st.download_button(
-                label="📄 Download CSV",
-                data=csv_data,
-                file_name=f"shopify_products_{int(time.time())}.csv",
-                mime="text/csv"
-            )
-        elif export_format == "JSON":
-            json_data = filtered_df.to_json(orient='records', indent=2)
-            st.download_button(
-                label="📄 Download JSON",
-                data=json_data,
-                file_name=f"shopify_products_{int(time.time())}.json",
-                mime="application/json"
-            )
-        elif export_format == "Excel":
-            # For Excel, we'll use CSV format as it's more universally supported
-            csv_data = filtered_df.to_csv(index=False)
-            st.download_button(
-                label="📄 Download Excel (CSV format)",
-                data=csv_data,
-                file_name=f"shopify_products_{int(time.time())}.csv",
-                mime="text/csv"
-            )
+        render_download(filtered_df, export_format, results['scraped_at'])
     
     # Footer
     st.markdown("---")